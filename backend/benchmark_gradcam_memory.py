@@ -0,0 +1,100 @@
+"""
+Grad-CAM Memory Benchmark for MedBot-AI
+Runs Grad-CAM repeatedly and checks that peak RSS stays flat across requests
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import psutil
+import torch
+import torch.nn as nn
+from torchvision import models
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from model.gradcam_utils import generate_gradcam
+
+MODEL_PATH = "densepneumo_ace.pt"
+DEVICE = torch.device("cpu")
+WARMUP_REQUESTS = 50
+
+
+def load_model(model_path, device):
+    """Load DenseNet121 (random weights if the checkpoint is missing; memory behaviour is the same)"""
+    model = models.densenet121(weights=None)
+    model.classifier = nn.Linear(model.classifier.in_features, 1)
+    if os.path.exists(model_path):
+        model.load_state_dict(torch.load(model_path, map_location=device))
+    else:
+        print(f"Note: {model_path} not found, using random weights")
+    model = model.to(device)
+    model.eval()
+    return model
+
+
+def rss_mb(process):
+    return process.memory_info().rss / (1024 * 1024)
+
+
+def run_benchmark(model, requests, report_every):
+    """
+    Run Grad-CAM `requests` times; returns (baseline_rss_mb, samples), the RSS right
+    after warm-up and [(request, rss_mb, peak_rss_mb, ms_per_request)]
+    """
+    process = psutil.Process()
+    target_layer = model.features[-1]
+    img_tensor = torch.randn(1, 3, 224, 224, device=DEVICE)
+
+    for _ in range(WARMUP_REQUESTS):
+        generate_gradcam(model, img_tensor, target_layer, DEVICE)
+    gc.collect()
+
+    samples = []
+    baseline = peak = rss_mb(process)
+    start = time.perf_counter()
+    for i in range(1, requests + 1):
+        # A fresh tensor per request, like the endpoint
+        img_tensor = torch.randn(1, 3, 224, 224, device=DEVICE)
+        generate_gradcam(model, img_tensor, target_layer, DEVICE)
+        peak = max(peak, rss_mb(process))
+
+        if i % report_every == 0 or i == requests:
+            elapsed = time.perf_counter() - start
+            samples.append((i, rss_mb(process), peak, 1000 * elapsed / report_every))
+            print(f"{i:>7}  rss={samples[-1][1]:8.1f} MB  peak={peak:8.1f} MB  {samples[-1][3]:7.1f} ms/req")
+            start = time.perf_counter()
+
+    return baseline, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grad-CAM peak RSS benchmark")
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--report-every", type=int, default=500)
+    parser.add_argument("--tolerance-mb", type=float, default=50.0,
+                        help="Maximum allowed peak RSS growth after warm-up")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("MedBot-AI Grad-CAM Memory Benchmark")
+    print("=" * 60)
+    print(f"Requests: {args.requests}  (after {WARMUP_REQUESTS} warm-up)")
+    print()
+
+    model = load_model(MODEL_PATH, DEVICE)
+    baseline, samples = run_benchmark(model, args.requests, min(args.report_every, args.requests))
+
+    growth = samples[-1][2] - baseline
+    print()
+    print(f"Peak RSS growth after warm-up: {growth:.1f} MB (baseline {baseline:.1f} MB)")
+    if growth > args.tolerance_mb:
+        print(f"✗ Peak RSS grew by more than {args.tolerance_mb:.0f} MB")
+        return 1
+    print("✓ Peak RSS stayed flat")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
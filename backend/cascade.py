@@ -0,0 +1,62 @@
+"""
+Early-exit cascade for MedBot-AI
+A cheap EfficientNetB0 scores every image; only uncertain ones go on to DenseNet121
+"""
+
+import csv
+import datetime
+import os
+import sys
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from model.architectures import create_model
+
+# Fast-model weights; the cascade is disabled when this file is missing.
+# notebooks/comparative_analysis.ipynb saves them after training EfficientNetB0.
+FAST_MODEL_PATH = os.environ.get("MEDBOT_FAST_MODEL_PATH", "efficientnet_b0.pt")
+
+# Fast-model probabilities inside [LOW, HIGH] are escalated to DenseNet121
+CASCADE_LOW = float(os.environ.get("MEDBOT_CASCADE_LOW", 0.1))
+CASCADE_HIGH = float(os.environ.get("MEDBOT_CASCADE_HIGH", 0.9))
+if not 0.0 <= CASCADE_LOW <= CASCADE_HIGH <= 1.0:
+    raise ValueError(f"Invalid cascade band: need 0 <= MEDBOT_CASCADE_LOW ({CASCADE_LOW}) "
+                     f"<= MEDBOT_CASCADE_HIGH ({CASCADE_HIGH}) <= 1")
+
+CASCADE_LOG_FILE = "logs/cascade_log.csv"
+CASCADE_LOG_FIELDS = ["timestamp", "filename", "fast_probability", "stage", "probability", "band_low", "band_high"]
+
+
+def load_fast_model(model_path, device):
+    """Load the fine-tuned EfficientNetB0, or return None if no weights are present"""
+    if not os.path.exists(model_path):
+        return None
+    fast_model = create_model("EfficientNetB0", pretrained=False)
+    fast_model.load_state_dict(torch.load(model_path, map_location=device))
+    fast_model = fast_model.to(device)
+    fast_model.eval()
+    return fast_model
+
+
+def needs_full_model(fast_probability, low=CASCADE_LOW, high=CASCADE_HIGH):
+    """True if the fast model is too uncertain to answer on its own"""
+    return low <= fast_probability <= high
+
+
+def log_cascade_decision(filename, fast_probability, stage, probability):
+    """Append one cascade decision to logs/cascade_log.csv"""
+    os.makedirs(os.path.dirname(CASCADE_LOG_FILE), exist_ok=True)
+    write_header = not os.path.exists(CASCADE_LOG_FILE)
+    with open(CASCADE_LOG_FILE, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CASCADE_LOG_FIELDS)
+        if write_header:
+            writer.writeheader()
+        writer.writerow({
+            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "filename": filename,
+            "fast_probability": round(fast_probability, 4),
+            "stage": stage,
+            "probability": round(probability, 4),
+            "band_low": CASCADE_LOW,
+            "band_high": CASCADE_HIGH,
+        })
@@ -0,0 +1,283 @@
+"""
+Embedding store for MedBot-AI
+Keeps the pooled DenseNet121 features of past studies and finds the most similar cases
+"""
+
+import csv
+import datetime
+import hashlib
+import os
+import threading
+import numpy as np
+import torch.nn.functional as F
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+EMBEDDING_DIM = 1024  # DenseNet121 pooled feature size
+CASE_FIELDS = ["case_id", "timestamp", "filename", "prediction", "confidence", "label", "source", "key"]
+
+# Switch from exhaustive search to the IVF index once the store is this large
+IVF_MIN_CASES = 50000
+IVF_TRAIN_SAMPLES_PER_LIST = 64
+IVF_DEFAULT_NPROBE = 8
+
+
+def forward_with_embedding(model, img_tensor):
+    """
+    Run DenseNet121 and return (logits, pooled features).
+    Mirrors DenseNet.forward, so the logits are identical to model(img_tensor)
+    and the embedding comes for free.
+    """
+    features = model.features(img_tensor)
+    out = F.relu(features, inplace=True)
+    pooled = F.adaptive_avg_pool2d(out, (1, 1)).flatten(1)
+    return model.classifier(pooled), pooled
+
+
+def image_key(image):
+    """Content key of a decoded PIL image, so resubmitting the same study is recognised"""
+    return hashlib.sha1(image.tobytes()).hexdigest()
+
+
+def _lock_store_dir(lock_path):
+    """
+    Take an exclusive, non-blocking lock on the store directory for the life of the process.
+    Two writers appending to the same files would pair vectors with the wrong cases.
+    """
+    lock_file = open(lock_path, "a+")
+    try:
+        if os.name == "nt":
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise RuntimeError(f"Embedding store {os.path.dirname(lock_path)} is in use by another process "
+                           f"(stop the server before writing to it from a script)")
+    return lock_file
+
+
+def _normalize(vectors):
+    """L2-normalise rows so inner product equals cosine similarity"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores, k):
+    """Indices of the k largest scores, best first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+class IVFIndex:
+    """
+    Inverted-file index: cases are bucketed by their nearest k-means centroid and
+    a query only scans the buckets of its `nprobe` closest centroids.
+    """
+    def __init__(self, vectors, n_lists, n_iter=10, seed=0):
+        rng = np.random.default_rng(seed)
+        n = len(vectors)
+        n_lists = max(1, min(n_lists, n))
+
+        # Train centroids on a sample, then assign every vector
+        n_train = min(n, n_lists * IVF_TRAIN_SAMPLES_PER_LIST)
+        sample = vectors[rng.choice(n, n_train, replace=False)]
+        centroids = sample[rng.choice(n_train, n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+
+        self.centroids = centroids
+        self.size = n
+        assign = self._assign(vectors)
+        self.order = np.argsort(assign, kind="stable")
+        self.offsets = np.searchsorted(assign[self.order], np.arange(n_lists + 1))
+
+    def _assign(self, vectors, batch_size=8192):
+        assign = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch_size):
+            block = vectors[start:start + batch_size]
+            assign[start:start + batch_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return assign
+
+    def candidates(self, query, nprobe):
+        """Ids of the indexed cases in the `nprobe` buckets closest to the query"""
+        lists = _top_k(self.centroids @ query, nprobe)
+        return np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+
+
+class EmbeddingStore:
+    """
+    Append-only store of normalised case embeddings plus their metadata.
+    Vectors are persisted as raw float32 rows in `embeddings.f32` and metadata in
+    `cases.csv`, both appended as cases arrive so the store survives restarts.
+    Only one EmbeddingStore may have a directory open at a time.
+    """
+    def __init__(self, store_dir, dim=EMBEDDING_DIM):
+        self.store_dir = store_dir
+        self.dim = dim
+        self.vectors_path = os.path.join(store_dir, "embeddings.f32")
+        self.cases_path = os.path.join(store_dir, "cases.csv")
+        self.index = None
+        self._lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+        self._lock_file = _lock_store_dir(os.path.join(store_dir, "store.lock"))
+        self._load()
+
+    def close(self):
+        """Release the directory lock so another process can open the store"""
+        self._lock_file.close()
+
+    def _read_cases(self):
+        """Parse cases.csv; returns (cases, needs_rewrite). A half-written last row is dropped."""
+        torn = False
+        if os.path.getsize(self.cases_path) > 0:
+            with open(self.cases_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        with open(self.cases_path, newline="") as f:
+            reader = csv.DictReader(f)
+            rows = list(reader)
+            # Stores written before the key column existed get the current header
+            rewrite = torn or reader.fieldnames != CASE_FIELDS
+        if torn and rows:
+            rows.pop()
+        cases = [dict(row, case_id=int(row["case_id"]), confidence=float(row["confidence"]),
+                      key=row.get("key") or row["filename"])
+                 for row in rows]
+        return cases, rewrite
+
+    def _load(self):
+        cases, rewrite_cases = [], False
+        if os.path.exists(self.cases_path):
+            cases, rewrite_cases = self._read_cases()
+
+        vectors = np.empty((0, self.dim), dtype=np.float32)
+        if os.path.exists(self.vectors_path):
+            vectors = np.fromfile(self.vectors_path, dtype=np.float32)
+            vectors = vectors[:len(vectors) // self.dim * self.dim].reshape(-1, self.dim)
+
+        # An interrupted write can leave one file ahead of the other. Trim both on disk,
+        # not just in memory, or later appends would pair vectors with the wrong cases.
+        n = min(len(cases), len(vectors))
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) != n * self.dim * 4:
+            os.truncate(self.vectors_path, n * self.dim * 4)
+        if rewrite_cases or len(cases) != n:
+            with open(self.cases_path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=CASE_FIELDS)
+                writer.writeheader()
+                writer.writerows(cases[:n])
+        self.cases = cases[:n]
+        self._vectors = np.empty((max(n, 1024), self.dim), dtype=np.float32)
+        self._vectors[:n] = vectors[:n]
+        self._size = n
+        self._keys = {(case["key"], case["source"]) for case in self.cases}
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self):
+        return self._vectors[:self._size]
+
+    def add(self, embeddings, filenames, predictions, confidences, labels=None, source="predict", keys=None):
+        """
+        Append a batch of embeddings with their per-case metadata; returns the new case ids.
+        A case whose (key, source) is already stored is skipped, so resubmitted studies
+        and repeated runs don't fill the store with copies. `keys` defaults to the filenames.
+        """
+        vectors = _normalize(np.asarray(embeddings).reshape(-1, self.dim))
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if labels is None:
+            labels = [""] * len(vectors)
+        if keys is None:
+            keys = filenames
+
+        with self._lock:
+            keep = []
+            for i, key in enumerate(keys):
+                if (key, source) not in self._keys:
+                    self._keys.add((key, source))
+                    keep.append(i)
+            if not keep:
+                return []
+            vectors = vectors[keep]
+
+            start = self._size
+            end = start + len(vectors)
+            if end > len(self._vectors):
+                grown = np.empty((max(end, 2 * len(self._vectors)), self.dim), dtype=np.float32)
+                grown[:start] = self._vectors[:start]
+                self._vectors = grown
+            self._vectors[start:end] = vectors
+
+            rows = [{
+                "case_id": start + n,
+                "timestamp": timestamp,
+                "filename": filenames[i],
+                "prediction": predictions[i],
+                "confidence": round(float(confidences[i]), 4),
+                "label": labels[i],
+                "source": source,
+                "key": keys[i],
+            } for n, i in enumerate(keep)]
+
+            write_header = not os.path.exists(self.cases_path)
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self.cases_path, "a", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=CASE_FIELDS)
+                if write_header:
+                    writer.writeheader()
+                writer.writerows(rows)
+
+            self.cases.extend(rows)
+            self._size = end
+
+        return list(range(start, end))
+
+    def build_index(self, n_lists=None, n_iter=10, seed=0):
+        """Build the IVF index over the current cases (defaults to ~sqrt(N) lists)"""
+        with self._lock:
+            vectors = self.vectors.copy()
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(vectors)))
+        self.index = IVFIndex(vectors, n_lists, n_iter=n_iter, seed=seed)
+
+    def search(self, query, k=5, nprobe=IVF_DEFAULT_NPROBE, exact=False):
+        """
+        Return the k most similar stored cases as metadata dicts with a `score`
+        (cosine similarity). Uses the IVF index when built unless `exact` is set;
+        cases added after the index was built are always scanned exhaustively.
+        """
+        query = _normalize(np.asarray(query).reshape(self.dim))
+        with self._lock:
+            size = self._size
+            vectors = self._vectors
+        index = self.index
+
+        if index is None or exact:
+            ids = _top_k(vectors[:size] @ query, k)
+            scores = vectors[ids] @ query
+        else:
+            candidates = np.concatenate([
+                index.candidates(query, nprobe),
+                np.arange(index.size, size),
+            ])
+            candidate_scores = vectors[candidates] @ query
+            best = _top_k(candidate_scores, k)
+            ids, scores = candidates[best], candidate_scores[best]
+
+        return [dict(self.cases[i], score=round(float(s), 4)) for i, s in zip(ids, scores)]
@@ -26,11 +26,13 @@ import pandas as pd
 import os
 from tqdm import tqdm
 import json
+from embedding_store import EmbeddingStore, forward_with_embedding
 
 # Configuration
 MODEL_PATH = "densepneumo_ace.pt"
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 OUTPUT_DIR = "evaluation_results"
+EMBEDDINGS_DIR = "embeddings"  # Shared with the backend's /similar endpoint
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # Image preprocessing (same as inference)
@@ -79,8 +81,8 @@ def load_model(model_path, device):
     return model
 
 
-def evaluate_model(model, dataloader, device):
-    """Run inference and collect predictions"""
+def evaluate_model(model, dataloader, device, embedding_store=None):
+    """Run inference and collect predictions (and optionally store the case embeddings)"""
     all_labels = []
     all_predictions = []
     all_probabilities = []
@@ -90,9 +92,15 @@ def evaluate_model(model, dataloader, device):
     with torch.no_grad():
         for images, labels, filenames in tqdm(dataloader):
             images = images.to(device)
-            outputs = model(images)
+            outputs, embeddings = forward_with_embedding(model, images)
             probabilities = torch.sigmoid(outputs).cpu().numpy().flatten()
             predictions = (probabilities >= 0.5).astype(int)
+
+            if embedding_store is not None:
+                embedding_store.add(
+                    embeddings.cpu().numpy(), list(filenames),
+                    ["Pneumonia Detected" if p else "Normal" for p in predictions],
+                    probabilities, labels=labels.tolist(), source="evaluation")
             
             all_labels.extend(labels.numpy())
             all_predictions.extend(predictions)
@@ -230,7 +238,7 @@ def save_predictions_csv(filenames, y_true, y_pred, y_proba, output_path):
     print(f"Predictions CSV saved to {output_path}")
 
 
-def main():
+def main(store_embeddings=False):
     """Main evaluation pipeline"""
     print("=" * 60)
     print("MedBot-AI Model Evaluation")
@@ -270,8 +278,10 @@ def main():
     dataloader = DataLoader(dataset, batch_size=32, shuffle=False, num_workers=0)
     print()
     
-    # Evaluate
-    y_true, y_pred, y_proba, filenames = evaluate_model(model, dataloader, DEVICE)
+    # Evaluate (optionally adding the embeddings to the similar-case store;
+    # images already stored by an earlier run are skipped)
+    embedding_store = EmbeddingStore(EMBEDDINGS_DIR) if store_embeddings else None
+    y_true, y_pred, y_proba, filenames = evaluate_model(model, dataloader, DEVICE, embedding_store)
     
     # Calculate metrics
     print("\nCalculating metrics...")
@@ -334,4 +344,8 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Evaluate the MedBot-AI model")
+    parser.add_argument("--store-embeddings", action="store_true",
+                        help=f"Add the evaluated images to the similar-case store in {EMBEDDINGS_DIR}/")
+    main(store_embeddings=parser.parse_args().store_embeddings)
@@ -0,0 +1,366 @@
+"""
+Batch jobs for MedBot-AI
+Scores a folder or archive of X-rays in the background, persists per-image results
+and pushes progress to subscribers (Server-Sent Events / WebSocket)
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import shutil
+import tarfile
+import threading
+import uuid
+import zipfile
+import zlib
+from upload_utils import decode_image_file, UploadRejected, MAX_UPLOAD_BYTES
+
+JOBS_DIR = "jobs"
+# Folder jobs may only read below this directory; override with MEDBOT_JOBS_DATA_ROOT
+JOBS_DATA_ROOT = os.environ.get("MEDBOT_JOBS_DATA_ROOT", "../data")
+JOB_BATCH_SIZE = 16
+KEEPALIVE_SECONDS = 15
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"}
+FINISHED_STATUSES = {"completed", "cancelled", "failed", "interrupted"}
+
+
+class JobError(Exception):
+    """Raised when a job cannot be created or found"""
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _is_image_name(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def resolve_job_folder(folder, data_root=JOBS_DATA_ROOT):
+    """Resolve a requested folder, refusing anything outside the data root"""
+    root = os.path.realpath(data_root)
+    path = os.path.realpath(os.path.join(root, folder))
+    if path != root and not path.startswith(root + os.sep):
+        raise JobError(f"Folder must be inside {data_root}", 400)
+    if not os.path.isdir(path):
+        raise JobError(f"Folder not found: {folder}", 404)
+    return path
+
+
+class ImageSource:
+    """
+    Iterates the images of a job as (name, size, opener) without extracting
+    anything to disk. Supports plain folders, .zip and .tar/.tar.gz archives.
+    """
+    def __init__(self, kind, path):
+        self.kind = kind
+        self.path = path
+
+    def __enter__(self):
+        if self.kind == "zip":
+            self._archive = zipfile.ZipFile(self.path)
+            self._members = [m for m in self._archive.infolist() if not m.is_dir() and _is_image_name(m.filename)]
+        elif self.kind == "tar":
+            self._archive = tarfile.open(self.path)
+            self._members = [m for m in self._archive.getmembers() if m.isfile() and _is_image_name(m.name)]
+        else:
+            self._archive = None
+            self._members = sorted(
+                os.path.relpath(os.path.join(d, f), self.path)
+                for d, _, files in os.walk(self.path) for f in files if _is_image_name(f))
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._archive is not None:
+            self._archive.close()
+
+    def __len__(self):
+        return len(self._members)
+
+    def __iter__(self):
+        for member in self._members:
+            if self.kind == "zip":
+                yield member.filename, member.file_size, lambda m=member: self._archive.open(m)
+            elif self.kind == "tar":
+                yield member.name, member.size, lambda m=member: self._archive.extractfile(m)
+            else:
+                path = os.path.join(self.path, member)
+                yield member, os.path.getsize(path), lambda p=path: open(p, "rb")
+
+
+class Job:
+    """State of one batch job; mirrored to <jobs_dir>/<id>/job.json"""
+    def __init__(self, job_id, job_dir, source_kind, source_path, status="queued",
+                 total=0, processed=0, created=None, error=None):
+        self.id = job_id
+        self.dir = job_dir
+        self.source_kind = source_kind
+        self.source_path = source_path
+        self.status = status
+        self.total = total
+        self.processed = processed
+        self.created = created or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.error = error
+        self.cancel_event = threading.Event()
+        self.subscribers = set()
+
+    @property
+    def results_path(self):
+        return os.path.join(self.dir, "results.jsonl")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "source": self.source_kind,
+            "total": self.total,
+            "processed": self.processed,
+            "created": self.created,
+            "error": self.error,
+        }
+
+    def save(self):
+        state = dict(self.to_dict(), source_path=self.source_path)
+        tmp_path = os.path.join(self.dir, "job.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=4)
+        os.replace(tmp_path, os.path.join(self.dir, "job.json"))
+
+    @classmethod
+    def load(cls, job_dir):
+        with open(os.path.join(job_dir, "job.json")) as f:
+            state = json.load(f)
+        return cls(state["job_id"], job_dir, state["source"], state["source_path"], state["status"],
+                   state["total"], state["processed"], state["created"], state["error"])
+
+
+class JobManager:
+    """
+    Runs jobs one at a time on a background thread.
+    `predict_batch(images, filenames)` does the batched inference and returns one
+    result dict per image. Results are appended to results.jsonl before being
+    published, so a client that reconnects can replay everything it missed.
+    """
+    def __init__(self, predict_batch, jobs_dir=JOBS_DIR, batch_size=JOB_BATCH_SIZE):
+        self.predict_batch = predict_batch
+        self.jobs_dir = jobs_dir
+        self.batch_size = batch_size
+        self.jobs = {}
+        self._queue = None
+        self._worker = None
+        self._loop = None
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._load_jobs()
+
+    def _load_jobs(self):
+        for job_id in os.listdir(self.jobs_dir):
+            job_dir = os.path.join(self.jobs_dir, job_id)
+            if not os.path.exists(os.path.join(job_dir, "job.json")):
+                continue
+            job = Job.load(job_dir)
+            # Jobs that were in flight when the server stopped cannot be resumed
+            if job.status not in FINISHED_STATUSES:
+                job.status, job.error = "interrupted", "Server restarted before the job finished"
+                job.save()
+            self.jobs[job.id] = job
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise JobError(f"Job not found: {job_id}", 404)
+        return job
+
+    def _new_job(self, source_kind, source_path=None):
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_dir)
+        return Job(job_id, job_dir, source_kind, source_path)
+
+    async def submit_folder(self, folder):
+        job = self._new_job("folder", resolve_job_folder(folder))
+        return await self._enqueue(job)
+
+    async def submit_archive(self, fileobj, filename):
+        """Copy an uploaded .zip/.tar(.gz) into the job directory and queue it"""
+        name = (filename or "").lower()
+        if name.endswith(".zip"):
+            kind, archive_name = "zip", "input.zip"
+        elif name.endswith((".tar", ".tar.gz", ".tgz")):
+            kind, archive_name = "tar", "input.tar"
+        else:
+            raise JobError("Archive must be a .zip, .tar or .tar.gz file", 415)
+
+        job = self._new_job(kind)
+        job.source_path = os.path.join(job.dir, archive_name)
+        fileobj.seek(0)
+        with open(job.source_path, "wb") as f:
+            await asyncio.to_thread(shutil.copyfileobj, fileobj, f)
+        if kind == "zip" and not zipfile.is_zipfile(job.source_path) or \
+                kind == "tar" and not tarfile.is_tarfile(job.source_path):
+            shutil.rmtree(job.dir)
+            raise JobError("Archive is corrupt or not a valid archive", 400)
+        return await self._enqueue(job)
+
+    async def _enqueue(self, job):
+        if self._worker is None:
+            self._loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._worker_loop())
+        job.save()
+        self.jobs[job.id] = job
+        await self._queue.put(job)
+        return job
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job.status in FINISHED_STATUSES:
+            return job
+        job.cancel_event.set()
+        if job.status == "queued":
+            self._finish(job, "cancelled")
+        return job
+
+    async def _worker_loop(self):
+        while True:
+            job = await self._queue.get()
+            if job.status != "queued":
+                continue
+            try:
+                await asyncio.to_thread(self._run, job)
+            except Exception as e:
+                # _run reports job errors itself; this catches failures while doing so
+                # (e.g. job.json cannot be written) so the worker keeps serving later jobs
+                print(f"Error: job {job.id} crashed: {e}")
+                job.status, job.error = "failed", str(e)
+                try:
+                    job.save()
+                except OSError:
+                    pass
+                self._publish(job, self._status_event(job))
+
+    def _run(self, job):
+        """Process one job on the worker thread"""
+        # A cancel that arrived after the job was dequeued but before it started;
+        # cancel() has usually marked it finished already, which must not be overwritten
+        if job.cancel_event.is_set():
+            if job.status not in FINISHED_STATUSES:
+                self._finish(job, "cancelled")
+            return
+        job.status = "running"
+        try:
+            with ImageSource(job.source_kind, job.source_path) as source:
+                job.total = len(source)
+                job.save()
+                self._publish(job, self._status_event(job))
+
+                batch = []
+                for item in source:
+                    batch.append(item)
+                    if len(batch) == self.batch_size:
+                        self._process_batch(job, batch)
+                        batch = []
+                    if job.cancel_event.is_set():
+                        break
+                if batch and not job.cancel_event.is_set():
+                    self._process_batch(job, batch)
+
+            self._finish(job, "cancelled" if job.cancel_event.is_set() else "completed")
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, "failed")
+
+    def _process_batch(self, job, batch):
+        results = [None] * len(batch)
+        images, names, positions = [], [], []
+        for i, (name, size, opener) in enumerate(batch):
+            try:
+                with opener() as f:
+                    images.append(decode_image_file(f, size, MAX_UPLOAD_BYTES))
+                names.append(name)
+                positions.append(i)
+            # Corrupt archive members fail only their own image, not the whole job
+            except (UploadRejected, OSError, KeyError, zipfile.BadZipFile, zlib.error, tarfile.TarError) as e:
+                results[i] = {"error": str(e)}
+
+        if images:
+            for i, result in zip(positions, self.predict_batch(images, names)):
+                results[i] = result
+
+        events = []
+        for (name, _, _), result in zip(batch, results):
+            job.processed += 1
+            events.append(dict(result, type="result", seq=job.processed, filename=name))
+
+        with open(job.results_path, "a") as f:
+            for event in events:
+                f.write(json.dumps(event) + "\n")
+        job.save()
+        for event in events:
+            self._publish(job, event)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.save()
+        self._publish(job, self._status_event(job))
+
+    def _status_event(self, job):
+        return dict(job.to_dict(), type="status")
+
+    def _publish(self, job, event):
+        for queue in list(job.subscribers):
+            self._loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def read_results(self, job_id, after=0, limit=None):
+        """Persisted result events with seq > after"""
+        job = self.get(job_id)
+        results = []
+        if not os.path.exists(job.results_path):
+            return results
+        with open(job.results_path) as f:
+            for line in f:
+                event = json.loads(line)
+                if event["seq"] > after:
+                    results.append(event)
+                    if limit is not None and len(results) >= limit:
+                        break
+        return results
+
+    async def events(self, job_id, after=0):
+        """
+        Replay persisted results after `after`, then follow the live job until it
+        finishes. Yields event dicts, or None when idle for KEEPALIVE_SECONDS.
+        """
+        job = self.get(job_id)
+        queue = asyncio.Queue()
+        job.subscribers.add(queue)
+        try:
+            last = after
+            # Replaying a large results.jsonl must not block the event loop
+            for event in await asyncio.to_thread(self.read_results, job_id, after):
+                yield event
+                last = event["seq"]
+
+            if job.status in FINISHED_STATUSES:
+                # Pick up anything written between the replay and the status check
+                for event in await asyncio.to_thread(self.read_results, job_id, last):
+                    yield event
+                yield self._status_event(job)
+                return
+
+            yield self._status_event(job)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event["type"] == "result":
+                    if event["seq"] <= last:
+                        continue
+                    last = event["seq"]
+                yield event
+                if event["type"] == "status" and event["status"] in FINISHED_STATUSES:
+                    return
+        finally:
+            job.subscribers.discard(queue)
@@ -1,18 +1,22 @@
 # backend/main.py
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, Form, UploadFile, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image
-import io
 import torch
 import torch.nn as nn
 from torchvision import models, transforms
-from fastapi.responses import FileResponse
+from fastapi.responses import Response
 import cv2
 import numpy as np
-import tempfile
 import os
 import sys
+import json
+import asyncio
+import threading
+from upload_utils import read_image_upload, UploadRejected, UploadSizeLimitMiddleware, MAX_UPLOAD_BYTES, MAX_ARCHIVE_BYTES
+from embedding_store import EmbeddingStore, forward_with_embedding, image_key, IVF_MIN_CASES
+from cascade import load_fast_model, needs_full_model, log_cascade_decision, FAST_MODEL_PATH
+from jobs import JobManager, JobError
 
 # Try to import gradcam utilities
 try:
@@ -25,6 +29,11 @@ except ImportError:
 
 app = FastAPI(title="MedBot")
 
+# Cap upload size while the body streams in (archives for batch jobs get a larger limit).
+# Added before CORS so CORS stays outermost and its 413 still carries the CORS headers.
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES,
+                   path_limits={"/jobs": MAX_ARCHIVE_BYTES})
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://127.0.0.1:3000", "*"],
@@ -34,6 +43,7 @@ app.add_middleware(
 )
 
 MODEL_PATH = "densepneumo_ace.pt"  # Updated model path
+EMBEDDINGS_DIR = "embeddings"
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 # Define model architecture 
@@ -43,6 +53,21 @@ model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE))
 model = model.to(DEVICE)
 model.eval()
 
+# One model instance is shared by the request handlers and the job worker thread;
+# Grad-CAM attaches hooks and toggles requires_grad, so every use holds this lock.
+# Handlers take it on a worker thread (asyncio.to_thread), never on the event loop.
+model_lock = threading.Lock()
+
+# Optional cheap first stage of the cascade (EfficientNetB0)
+fast_model = load_fast_model(FAST_MODEL_PATH, DEVICE)
+if fast_model is None:
+    print(f"Info: {FAST_MODEL_PATH} not found. Cascade disabled, every image goes to DenseNet121.")
+
+# Pooled DenseNet features of past studies, for similar-case search
+embedding_store = EmbeddingStore(EMBEDDINGS_DIR)
+if len(embedding_store) >= IVF_MIN_CASES:
+    embedding_store.build_index()
+
 # Image preprocessing 
 transform = transforms.Compose([
     transforms.Resize((224, 224)),
@@ -51,6 +76,44 @@ transform = transforms.Compose([
                          std=[0.229, 0.224, 0.225])
 ])
 
+def predict_batch(images, filenames):
+    """Batched DenseNet121 inference for background jobs; also feeds the similar-case store"""
+    batch = torch.stack([transform(image) for image in images]).to(DEVICE) #type:ignore
+    with model_lock, torch.no_grad():
+        output, embeddings = forward_with_embedding(model, batch)
+        probabilities = torch.sigmoid(output).flatten().tolist()
+    predictions = ["Pneumonia Detected" if p >= 0.5 else "Normal" for p in probabilities]
+    embedding_store.add(embeddings.cpu().numpy(), filenames, predictions, probabilities, source="job",
+                        keys=[image_key(image) for image in images])
+    return [{"prediction": pred, "confidence": round(p, 4)} for pred, p in zip(predictions, probabilities)]
+
+job_manager = JobManager(predict_batch)
+
+def run_cascade(img_tensor):
+    """
+    Cascade inference: fast model first, DenseNet121 only when it is uncertain.
+    Returns (fast_probability, stage, probability, embedding)
+    """
+    with torch.no_grad():
+        fast_probability = None
+        if fast_model is not None:
+            fast_probability = torch.sigmoid(fast_model(img_tensor)).item()
+        if fast_probability is not None and not needs_full_model(fast_probability):
+            return fast_probability, "fast", fast_probability, None
+        with model_lock:
+            output, embedding = forward_with_embedding(model, img_tensor)
+        return fast_probability, "full", torch.sigmoid(output).item(), embedding
+
+def embed_image(img_tensor):
+    """Pooled DenseNet121 embedding of one preprocessed image"""
+    with model_lock, torch.no_grad():
+        return forward_with_embedding(model, img_tensor)[1]
+
+def locked_gradcam(img_tensor):
+    """Grad-CAM on the last features block of DenseNet121"""
+    with model_lock:
+        return generate_gradcam(model, img_tensor, model.features[-1], DEVICE)
+
 @app.get("/")
 def read_root():
     return {"message": "MedBot backend loaded successfully."}
@@ -58,16 +121,20 @@ def read_root():
 @app.post("/predict")
 async def predict(file: UploadFile = File(...)):
     try:
-        # Read and Preprocess Image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
+        # Validate and Preprocess Image
+        image = await read_image_upload(file)
         img_tensor = transform(image).unsqueeze(0).to(DEVICE) #type:ignore
 
-        # Run Inference
-        with torch.no_grad():
-            output = model(img_tensor)
-            probability = torch.sigmoid(output).item()
-            prediction = "Pneumonia Detected" if probability >= 0.5 else "Normal"
+        # Run Inference (cascade: fast model first, DenseNet121 only when it is uncertain)
+        fast_probability, stage, probability, embedding = await asyncio.to_thread(run_cascade, img_tensor)
+        prediction = "Pneumonia Detected" if probability >= 0.5 else "Normal"
+
+        # Early exits have no DenseNet embedding, so only full-stage studies are searchable
+        if embedding is not None:
+            embedding_store.add(embedding.cpu().numpy(), [file.filename], [prediction], [probability],
+                                keys=[image_key(image)])
+        if fast_probability is not None:
+            log_cascade_decision(file.filename, fast_probability, stage, probability)
 
         # Log Results
         import csv, datetime, os
@@ -92,9 +159,34 @@ async def predict(file: UploadFile = File(...)):
 
         return JSONResponse({
             "prediction": prediction,
-            "confidence": round(probability, 4)
+            "confidence": round(probability, 4),
+            "model": "DenseNet121" if stage == "full" else "EfficientNetB0"
         })
 
+    except UploadRejected as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.post("/similar")
+async def similar(file: UploadFile = File(...), k: int = 5):
+    """
+    Returns the k past cases whose DenseNet121 embeddings are closest to the upload.
+    """
+    if not 1 <= k <= 100:
+        return JSONResponse({"error": "k must be between 1 and 100"}, status_code=400)
+
+    try:
+        image = await read_image_upload(file)
+        img_tensor = transform(image).unsqueeze(0).to(DEVICE) #type:ignore
+
+        embedding = await asyncio.to_thread(embed_image, img_tensor)
+
+        matches = embedding_store.search(embedding.cpu().numpy()[0], k=k)
+        return JSONResponse({"matches": matches, "total_cases": len(embedding_store)})
+
+    except UploadRejected as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
@@ -107,25 +199,126 @@ async def gradcam(file: UploadFile = File(...)):
         return JSONResponse({"error": "GradCAM functionality not available"}, status_code=501)
     
     try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
+        image = await read_image_upload(file)
         img_tensor = transform(image).unsqueeze(0).to(DEVICE) #type:ignore
 
-        # Pick target conv layer (last features block of DenseNet)
-        target_layer = model.features[-1]
-
-        heatmap = generate_gradcam(model, img_tensor, target_layer, DEVICE)
+        heatmap = await asyncio.to_thread(locked_gradcam, img_tensor)
 
         # Blend heatmap with original image
         img_cv = np.array(image.resize((224, 224)))[:, :, ::-1]  # RGB→BGR
         heatmap_color = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET) #type:ignore
         overlay = cv2.addWeighted(img_cv, 0.6, heatmap_color, 0.4, 0)
 
-        # Save temporary image
-        tmp_path = os.path.join(tempfile.gettempdir(), "gradcam_result.png")
-        cv2.imwrite(tmp_path, overlay)
+        # Encode in memory (no shared temp file between concurrent requests)
+        ok, png = cv2.imencode(".png", overlay)
+        if not ok:
+            return JSONResponse({"error": "Failed to encode Grad-CAM image"}, status_code=500)
 
-        return FileResponse(tmp_path, media_type="image/png", filename="gradcam_result.png")
+        return Response(png.tobytes(), media_type="image/png",
+                        headers={"Content-Disposition": 'attachment; filename="gradcam_result.png"'})
 
+    except UploadRejected as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.post("/jobs")
+async def create_job(folder: str = Form(None), file: UploadFile = File(None)):
+    """
+    Starts a background batch job over a server-side folder (relative to the data
+    root) or an uploaded .zip/.tar(.gz) archive. Returns the job ID immediately.
+    """
+    if (folder is None) == (file is None):
+        return JSONResponse({"error": "Provide exactly one of 'folder' or 'file'"}, status_code=400)
+
+    try:
+        if folder is not None:
+            job = await job_manager.submit_folder(folder)
+        else:
+            job = await job_manager.submit_archive(file.file, file.filename)
+        return JSONResponse(job.to_dict(), status_code=202)
+    except JobError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    try:
+        return job_manager.get(job_id).to_dict()
+    except JobError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+
+@app.get("/jobs/{job_id}/results")
+def job_results(job_id: str, after: int = 0, limit: int = 1000):
+    """Persisted per-image results with seq > after"""
+    try:
+        return {"results": job_manager.read_results(job_id, after, limit)}
+    except JobError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    try:
+        return job_manager.cancel(job_id).to_dict()
+    except JobError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, after: int = 0):
+    """
+    Server-Sent Events stream of a job's results and status changes.
+    Reconnecting clients resume via the Last-Event-ID header (or ?after=).
+    """
+    try:
+        job_manager.get(job_id)
+    except JobError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        after = int(last_event_id)
+
+    async def stream():
+        async for event in job_manager.events(job_id, after):
+            if event is None:
+                yield ": keepalive\n\n"
+            elif event["type"] == "result":
+                yield f"id: {event['seq']}\nevent: result\ndata: {json.dumps(event)}\n\n"
+            else:
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/jobs/{job_id}/ws")
+async def job_websocket(websocket: WebSocket, job_id: str, after: int = 0):
+    """
+    WebSocket stream of a job's results and status changes (JSON messages).
+    Send {"action": "cancel"} to cancel the job.
+    """
+    await websocket.accept()
+    try:
+        job_manager.get(job_id)
+    except JobError as e:
+        await websocket.send_json({"type": "error", "error": str(e)})
+        await websocket.close()
+        return
+
+    async def listen():
+        try:
+            while True:
+                message = await websocket.receive_json()
+                if message.get("action") == "cancel":
+                    job_manager.cancel(job_id)
+        except (WebSocketDisconnect, ValueError):
+            pass
+
+    listener = asyncio.create_task(listen())
+    try:
+        async for event in job_manager.events(job_id, after):
+            await websocket.send_json(event if event is not None else {"type": "ping"})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        listener.cancel()
@@ -0,0 +1,162 @@
+"""
+Upload handling helpers for MedBot-AI
+Enforces a size limit, sniffs magic bytes and decodes images straight from the upload buffer
+"""
+
+import json
+import os
+from fastapi import UploadFile
+from PIL import Image
+
+# Maximum accepted upload size (bytes); override with MEDBOT_MAX_UPLOAD_BYTES
+MAX_UPLOAD_BYTES = int(os.environ.get("MEDBOT_MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+# Maximum accepted archive size for batch jobs; override with MEDBOT_MAX_ARCHIVE_BYTES
+MAX_ARCHIVE_BYTES = int(os.environ.get("MEDBOT_MAX_ARCHIVE_BYTES", 2 * 1024 * 1024 * 1024))
+CHUNK_SIZE = 64 * 1024
+
+# Magic byte signatures of the image formats we accept
+IMAGE_SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": "PNG",
+    b"\xff\xd8\xff": "JPEG",
+    b"BM": "BMP",
+    b"II*\x00": "TIFF",
+    b"MM\x00*": "TIFF",
+}
+SNIFF_BYTES = 12
+
+
+class UploadRejected(Exception):
+    """Raised when an upload is refused before decoding"""
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_image_format(header):
+    """Return the image format implied by the leading bytes, or None"""
+    for signature, fmt in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return fmt
+    return None
+
+
+def format_limit(max_bytes):
+    """Human-readable size limit for error messages (one decimal, so sub-MB limits don't read as 0 MB)"""
+    if max_bytes < 1024 * 1024:
+        return f"{max_bytes} bytes"
+    return f"{max_bytes / (1024 * 1024):.1f} MB"
+
+
+def upload_size(file: UploadFile, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Size of the spooled upload in bytes.
+    Uses the size recorded by the multipart parser when available, otherwise
+    walks the buffer in chunks and stops as soon as the limit is exceeded.
+    """
+    if file.size is not None:
+        return file.size
+
+    buffer = file.file
+    buffer.seek(0)
+    total = 0
+    while True:
+        chunk = buffer.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            break
+    return total
+
+
+def decode_image_file(fileobj, size, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Validate a seekable binary file object holding an image and decode it to RGB.
+    The size limit and magic bytes are checked before any decode work, and the
+    image is decoded directly from the file object (no intermediate bytes copy).
+    """
+    if size > max_bytes:
+        raise UploadRejected(f"File too large (limit {format_limit(max_bytes)})", 413)
+
+    fileobj.seek(0)
+    fmt = sniff_image_format(fileobj.read(SNIFF_BYTES))
+    if fmt is None:
+        raise UploadRejected("Unsupported file type; expected a PNG, JPEG, BMP or TIFF image", 415)
+
+    fileobj.seek(0)
+    try:
+        with Image.open(fileobj, formats=[fmt]) as image:
+            return image.convert("RGB")
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise UploadRejected(f"Could not decode image: {e}", 400)
+
+
+async def read_image_upload(file: UploadFile, max_bytes=MAX_UPLOAD_BYTES):
+    """Validate an uploaded image and decode it straight from the upload's spooled buffer"""
+    return decode_image_file(file.file, upload_size(file, max_bytes), max_bytes)
+
+
+def content_length_exceeded(headers, max_bytes=MAX_UPLOAD_BYTES):
+    """True if the declared request body is larger than the upload limit (plus multipart overhead)"""
+    length = headers.get("content-length")
+    if length is None or not length.isdigit():
+        return False
+    return int(length) > max_bytes + CHUNK_SIZE
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware that caps POST body size while the body streams in.
+    A declared Content-Length over the limit is refused up front; otherwise the
+    received bytes are counted (covers chunked uploads) and the request is cut
+    off with 413 as soon as the count passes the limit, before the multipart
+    parser can spool the rest to disk. `path_limits` overrides the limit per path.
+    """
+    def __init__(self, app, max_bytes=MAX_UPLOAD_BYTES, path_limits=None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def _send_413(self, send, limit):
+        body = json.dumps({"error": f"File too large (limit {format_limit(limit)})"}).encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+
+        limit = self.path_limits.get(scope["path"], self.max_bytes)
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        if content_length_exceeded(headers, limit):
+            return await self._send_413(send, limit)
+
+        received = 0
+        rejected = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit + CHUNK_SIZE:
+                    # Answer now and make the app see a disconnect, so it stops reading
+                    rejected = True
+                    if not response_started:
+                        await self._send_413(send, limit)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if rejected:
+                return  # the 413 has already been sent
+            response_started = True
+            await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
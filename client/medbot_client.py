@@ -0,0 +1,300 @@
+"""
+Python client for the MedBot-AI API
+Async and sync clients with keep-alive connection pools, bounded concurrency,
+retries with backoff on 429/503 and helpers for submitting whole directories
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import httpx
+
+DEFAULT_BASE_URL = "http://localhost:8000"
+RETRY_STATUS_CODES = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+# Transport errors retried for any method: the request never reached the server
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# Errors that may occur after the server received the request; only safe to retry idempotent calls
+TRANSPORT_ERRORS = (httpx.ConnectError, httpx.ReadError, httpx.RemoteProtocolError, httpx.TimeoutException)
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"}
+MIME_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg",
+              ".bmp": "image/bmp", ".tif": "image/tiff", ".tiff": "image/tiff"}
+
+
+class MedBotError(Exception):
+    """Raised when the API answers with an error status"""
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+def iter_images(directory, recursive=False):
+    """Yield image paths under a directory as they are scanned (no full listing up front)"""
+    for entry in os.scandir(directory):
+        if entry.is_dir() and recursive:
+            yield from iter_images(entry.path, recursive)
+        elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+            yield entry.path
+
+
+def _retry_delay(attempt, response, backoff, max_backoff):
+    """Honour Retry-After when the server sends it, else exponential backoff with jitter"""
+    if response is not None:
+        retry_after = response.headers.get("retry-after", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), max_backoff)
+    return min(backoff * (2 ** attempt), max_backoff) * random.uniform(0.5, 1.0)
+
+
+def _should_retry(method, response, error, attempt, max_retries):
+    """
+    429/503 are always retried. A POST that failed in transit is only retried if it
+    was never sent, since the server may already have logged and stored it.
+    """
+    if attempt >= max_retries:
+        return False
+    if error is not None:
+        retryable = TRANSPORT_ERRORS if method.upper() in IDEMPOTENT_METHODS else UNSENT_ERRORS
+        return isinstance(error, retryable)
+    return response.status_code in RETRY_STATUS_CODES
+
+
+def _upload(file_path):
+    name = os.path.basename(file_path)
+    mime = MIME_TYPES.get(os.path.splitext(name)[1].lower(), "application/octet-stream")
+    return name, open(file_path, "rb"), mime
+
+
+def _raise_for_error(response):
+    if response.status_code < 400:
+        return
+    try:
+        message = response.json().get("error", response.text)
+    except ValueError:
+        message = response.text
+    raise MedBotError(response.status_code, message)
+
+
+class AsyncMedBotClient:
+    """
+    Asyncio client. One instance keeps a pool of keep-alive connections, so reuse
+    it for all requests (ideally as `async with AsyncMedBotClient() as client:`).
+    """
+    def __init__(self, base_url=DEFAULT_BASE_URL, max_concurrency=8, max_retries=3,
+                 backoff=0.5, max_backoff=30.0, timeout=60.0):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _request(self, method, path, file_path=None, **kwargs):
+        async with self._semaphore:
+            attempt = 0
+            while True:
+                response, error = None, None
+                upload = _upload(file_path) if file_path else None
+                try:
+                    files = {"file": upload} if upload else None
+                    response = await self._client.request(method, path, files=files, **kwargs)
+                except httpx.HTTPError as e:
+                    error = e
+                finally:
+                    if upload:
+                        upload[1].close()
+
+                if not _should_retry(method, response, error, attempt, self.max_retries):
+                    break
+                await asyncio.sleep(_retry_delay(attempt, response, self.backoff, self.max_backoff))
+                attempt += 1
+
+        if error is not None:
+            raise error
+        _raise_for_error(response)
+        return response
+
+    async def health(self):
+        return (await self._request("GET", "/")).json()
+
+    async def predict(self, file_path):
+        """Prediction for one image: {"prediction", "confidence", "model"}"""
+        return (await self._request("POST", "/predict", file_path)).json()
+
+    async def similar(self, file_path, k=5):
+        """The k most similar past cases for one image"""
+        return (await self._request("POST", "/similar", file_path, params={"k": k})).json()
+
+    async def gradcam(self, file_path, output_path=None):
+        """Grad-CAM overlay PNG bytes, optionally also written to output_path"""
+        content = (await self._request("POST", "/gradcam", file_path)).content
+        if output_path:
+            with open(output_path, "wb") as f:
+                f.write(content)
+        return content
+
+    async def _predict_or_error(self, file_path):
+        try:
+            return file_path, await self.predict(file_path)
+        except (MedBotError, httpx.HTTPError, OSError) as e:
+            return file_path, {"error": str(e)}
+
+    async def predict_directory(self, directory, recursive=False):
+        """
+        Submit every image in a directory and yield (path, result) pairs as they complete.
+        At most 2 x max_concurrency submissions are queued at once, so huge
+        directories are never loaded into memory. Failed images yield {"error": ...}.
+        If the caller stops iterating early, uploads still in flight are cancelled.
+        """
+        pending = set()
+        try:
+            for file_path in iter_images(directory, recursive):
+                if len(pending) >= 2 * self.max_concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+                pending.add(asyncio.ensure_future(self._predict_or_error(file_path)))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+class MedBotClient:
+    """
+    Blocking client with the same API. Requests share one keep-alive pool and
+    predict_directory fans out over a bounded thread pool.
+    """
+    def __init__(self, base_url=DEFAULT_BASE_URL, max_concurrency=8, max_retries=3,
+                 backoff=0.5, max_backoff=30.0, timeout=60.0):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._client = httpx.Client(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._client.close()
+
+    def _request(self, method, path, file_path=None, **kwargs):
+        with self._semaphore:
+            attempt = 0
+            while True:
+                response, error = None, None
+                upload = _upload(file_path) if file_path else None
+                try:
+                    files = {"file": upload} if upload else None
+                    response = self._client.request(method, path, files=files, **kwargs)
+                except httpx.HTTPError as e:
+                    error = e
+                finally:
+                    if upload:
+                        upload[1].close()
+
+                if not _should_retry(method, response, error, attempt, self.max_retries):
+                    break
+                time.sleep(_retry_delay(attempt, response, self.backoff, self.max_backoff))
+                attempt += 1
+
+        if error is not None:
+            raise error
+        _raise_for_error(response)
+        return response
+
+    def health(self):
+        return self._request("GET", "/").json()
+
+    def predict(self, file_path):
+        """Prediction for one image: {"prediction", "confidence", "model"}"""
+        return self._request("POST", "/predict", file_path).json()
+
+    def similar(self, file_path, k=5):
+        """The k most similar past cases for one image"""
+        return self._request("POST", "/similar", file_path, params={"k": k}).json()
+
+    def gradcam(self, file_path, output_path=None):
+        """Grad-CAM overlay PNG bytes, optionally also written to output_path"""
+        content = self._request("POST", "/gradcam", file_path).content
+        if output_path:
+            with open(output_path, "wb") as f:
+                f.write(content)
+        return content
+
+    def _predict_or_error(self, file_path):
+        try:
+            return file_path, self.predict(file_path)
+        except (MedBotError, httpx.HTTPError, OSError) as e:
+            return file_path, {"error": str(e)}
+
+    def predict_directory(self, directory, recursive=False):
+        """Threaded counterpart of AsyncMedBotClient.predict_directory; yields (path, result) as completed"""
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            pending = set()
+            try:
+                for file_path in iter_images(directory, recursive):
+                    if len(pending) >= 2 * self.max_concurrency:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+                    pending.add(executor.submit(self._predict_or_error, file_path))
+
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            finally:
+                # Drop queued uploads on early exit; only the ones already running finish
+                for future in pending:
+                    future.cancel()
+
+
+async def _main(args):
+    async with AsyncMedBotClient(args.url, max_concurrency=args.concurrency) as client:
+        async for file_path, result in client.predict_directory(args.directory, recursive=args.recursive):
+            if "error" in result:
+                print(f"{file_path}\tERROR\t{result['error']}")
+            else:
+                print(f"{file_path}\t{result['prediction']}\t{result['confidence']}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Submit a directory of X-rays to the MedBot API")
+    parser.add_argument("directory")
+    parser.add_argument("--url", default=DEFAULT_BASE_URL)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--recursive", action="store_true")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,27 @@
+import torch.nn as nn
+from torchvision import models
+
+MODEL_NAMES = ["DenseNet121", "ResNet50", "EfficientNetB0"]
+
+
+def create_model(name, pretrained=True):
+    """
+    Build one of the compared architectures with a single-logit head
+    (binary pneumonia classification). Pretrained weights are ImageNet.
+    """
+    weights = "DEFAULT" if pretrained else None
+    if name == "DenseNet121":
+        model = models.densenet121(weights=weights)
+        in_features = model.classifier.in_features
+        model.classifier = nn.Linear(in_features, 1)
+    elif name == "ResNet50":
+        model = models.resnet50(weights=weights)
+        in_features = model.fc.in_features
+        model.fc = nn.Linear(in_features, 1)
+    elif name == "EfficientNetB0":
+        model = models.efficientnet_b0(weights=weights)
+        in_features = model.classifier[1].in_features
+        model.classifier[1] = nn.Linear(in_features, 1) #type:ignore
+    else:
+        raise ValueError("Model not supported")
+    return model
@@ -0,0 +1,216 @@
+"""
+Inference Benchmark for MedBot-AI architectures
+Measures CPU latency, throughput, parameter count, FLOPs, peak memory, load time and
+TorchScript compile time for each architecture (eager and optimized) and extends model_comparison_results.csv
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import psutil
+import torch
+from torch.utils.flop_counter import FlopCounterMode
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from model.architectures import create_model, MODEL_NAMES
+
+RESULTS_CSV = os.path.join(os.path.dirname(__file__), '..', 'notebooks', 'model_comparison_results.csv')
+BASE_COLUMNS = ["model", "acc", "f1", "auc", "val_loss", "train_time_sec"]
+VARIANTS = ["eager", "optimized"]
+BATCH_SIZES = [1, 8, 32]
+IMAGE_SHAPE = (3, 224, 224)
+
+
+class PeakRSS:
+    """Samples the process RSS on a background thread and records the peak"""
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = self.process.memory_info().rss
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def load_for_inference(name, weights_path, variant):
+    """
+    Load the model as a server would at startup: eager from a state_dict checkpoint,
+    optimized from the frozen TorchScript artifact saved by compile_optimized.
+    optimize_for_inference output cannot be serialized, so that pass runs at load time.
+    """
+    if variant == "optimized":
+        return torch.jit.optimize_for_inference(torch.jit.load(weights_path, map_location="cpu"))
+    model = create_model(name, pretrained=False)
+    model.load_state_dict(torch.load(weights_path, map_location="cpu"))
+    model.eval()
+    return model
+
+
+def compile_optimized(name, weights_path, output_path):
+    """Trace and freeze a checkpoint into a TorchScript artifact (one-off build step); returns compile seconds"""
+    start = time.perf_counter()
+    model = load_for_inference(name, weights_path, "eager")
+    with torch.no_grad():
+        frozen = torch.jit.freeze(torch.jit.trace(model, torch.randn(1, *IMAGE_SHAPE)))
+    compile_time = time.perf_counter() - start
+    torch.jit.save(frozen, output_path)
+    return compile_time
+
+
+def count_flops(model):
+    """Forward-pass FLOPs for a single image (multiply and add counted separately)"""
+    with torch.no_grad(), FlopCounterMode(display=False) as counter:
+        model(torch.randn(1, *IMAGE_SHAPE))
+    return counter.get_total_flops()
+
+
+def measure_latency(model, batch_size, warmup, iters):
+    """Median and p95 latency (ms) of one forward pass at the given batch size"""
+    batch = torch.randn(batch_size, *IMAGE_SHAPE)
+    timings = []
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(batch)
+        for _ in range(iters):
+            start = time.perf_counter()
+            model(batch)
+            timings.append(1000 * (time.perf_counter() - start))
+    timings.sort()
+    return statistics.median(timings), timings[min(len(timings) - 1, int(0.95 * len(timings)))]
+
+
+def benchmark(name, variant, weights_path, batch_sizes, warmup, iters, threads):
+    """Benchmark one (architecture, variant); runs in a fresh process so memory figures are isolated"""
+    torch.set_num_threads(threads)
+    baseline_rss = psutil.Process().memory_info().rss
+
+    with PeakRSS() as memory:
+        start = time.perf_counter()
+        model = load_for_inference(name, weights_path, variant)
+        load_time = time.perf_counter() - start
+
+        row = {"model": name, "variant": variant, "threads": threads,
+               "load_time_sec": round(load_time, 3)}
+        for batch_size in batch_sizes:
+            median_ms, p95_ms = measure_latency(model, batch_size, warmup, iters)
+            row[f"latency_ms_bs{batch_size}"] = round(median_ms, 2)
+            row[f"latency_p95_ms_bs{batch_size}"] = round(p95_ms, 2)
+            row[f"throughput_img_s_bs{batch_size}"] = round(1000 * batch_size / median_ms, 1)
+
+    row["peak_mem_mb"] = round((memory.peak - baseline_rss) / (1024 * 1024), 1)
+    return row
+
+
+def run_isolated(fn, *args):
+    """Run fn(*args) in a fresh spawned process so memory and load figures don't leak between runs"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def describe(name):
+    """Parameter count and FLOPs of an architecture (identical for both variants)"""
+    model = create_model(name, pretrained=False).eval()
+    return {
+        "params_m": round(sum(p.numel() for p in model.parameters()) / 1e6, 2),
+        "gflops": round(count_flops(model) / 1e9, 2),
+    }
+
+
+def merge_results(rows, results_csv):
+    """
+    Upsert benchmark rows on (model, variant) and write the CSV. Rows from earlier runs
+    that this run did not touch are kept, and every model keeps its accuracy/F1/AUC columns.
+    """
+    bench_df = pd.DataFrame(rows)
+    if not os.path.exists(results_csv):
+        bench_df.to_csv(results_csv, index=False)
+        return bench_df
+
+    existing_df = pd.read_csv(results_csv)
+    base_df = existing_df[[c for c in BASE_COLUMNS if c in existing_df.columns]].drop_duplicates("model")
+
+    if "variant" in existing_df.columns:
+        old_bench_df = existing_df.drop(columns=[c for c in BASE_COLUMNS if c != "model"], errors="ignore")
+        old_bench_df = old_bench_df.dropna(subset=["variant"])
+        rerun = old_bench_df.set_index(["model", "variant"]).index.isin(bench_df.set_index(["model", "variant"]).index)
+        bench_df = pd.concat([old_bench_df[~rerun], bench_df], ignore_index=True)
+
+    # Outer join: models without benchmark rows keep their accuracy-only row
+    results_df = base_df.merge(bench_df, on="model", how="outer")
+    order = {name: i for i, name in enumerate(list(base_df["model"]) + MODEL_NAMES)}
+    results_df["_order"] = results_df["model"].map(order)
+    results_df = results_df.sort_values(["_order", "variant"], na_position="first", kind="stable")
+    results_df = results_df.drop(columns="_order").reset_index(drop=True)
+    results_df.to_csv(results_csv, index=False)
+    return results_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU inference benchmark for the compared architectures")
+    parser.add_argument("--models", nargs="+", default=MODEL_NAMES, choices=MODEL_NAMES)
+    parser.add_argument("--variants", nargs="+", default=VARIANTS, choices=VARIANTS)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=BATCH_SIZES)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    parser.add_argument("--output", default=RESULTS_CSV)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("MedBot-AI Architecture Inference Benchmark")
+    print("=" * 60)
+    print(f"Models: {', '.join(args.models)}")
+    print(f"Variants: {', '.join(args.variants)}  Batch sizes: {args.batch_sizes}  Threads: {args.threads}")
+    print()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in args.models:
+            # Load time is measured from an artifact on disk, like the backend's startup;
+            # the one-off TorchScript compile is reported separately as compile_time_sec
+            eager_path = os.path.join(tmp_dir, f"{name}.pt")
+            torch.save(create_model(name, pretrained=False).state_dict(), eager_path)
+            info = describe(name)
+
+            for variant in args.variants:
+                print(f"🔹 Benchmarking {name} ({variant})")
+                weights_path, compile_time = eager_path, None
+                if variant == "optimized":
+                    weights_path = os.path.join(tmp_dir, f"{name}_optimized.pt")
+                    compile_time = round(run_isolated(compile_optimized, name, eager_path, weights_path), 3)
+                row = run_isolated(benchmark, name, variant, weights_path, args.batch_sizes,
+                                   args.warmup, args.iters, args.threads)
+                row["compile_time_sec"] = compile_time
+                row.update(info)
+                rows.append(row)
+                latencies = "  ".join(f"bs{b}={row[f'latency_ms_bs{b}']:.1f}ms" for b in args.batch_sizes)
+                print(f"   {latencies}  peak={row['peak_mem_mb']:.0f}MB  load={row['load_time_sec']:.2f}s")
+
+    results_df = merge_results(rows, args.output)
+    print()
+    print(results_df.to_string(index=False))
+    print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
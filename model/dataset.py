@@ -24,4 +24,35 @@ class CXRDataset(Dataset):
             img = self.transform(img)
 
         label = int(row['label'])
-        return img, label
\ No newline at end of file
+        return img, label
+
+
+class CXRArrayDataset(Dataset):
+    """
+    A PyTorch Dataset for Chest X-ray images backed by compact label arrays
+    (see model/sampling.py) instead of a DataFrame.
+    `indices` selects the rows to use, e.g. the output of stratified_split.
+    """
+    def __init__(self, images, labels, img_dir, transform=None, indices=None):
+        self.images = images
+        self.labels = labels
+        self.indices = indices if indices is not None else range(len(labels))
+        self.img_dir = img_dir
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        row = self.indices[idx]
+        name = self.images[row]
+        if isinstance(name, bytes):
+            name = name.decode()
+        img_path = os.path.join(self.img_dir, name)
+        img = Image.open(img_path).convert('RGB')
+
+        if self.transform:
+            img = self.transform(img)
+
+        label = int(self.labels[row])
+        return img, label
@@ -1,52 +1,71 @@
+import contextlib
 import torch
 import cv2
 import numpy as np
 
+
+@contextlib.contextmanager
+def frozen_parameters(model):
+    """
+    Temporarily stop autograd from tracking the model's parameters,
+    restoring each parameter's requires_grad flag afterwards.
+    """
+    params = list(model.parameters())
+    flags = [p.requires_grad for p in params]
+    for p in params:
+        p.requires_grad_(False)
+    try:
+        yield
+    finally:
+        for p, flag in zip(params, flags):
+            p.requires_grad_(flag)
+
+
 def generate_gradcam(model, img_tensor, target_layer, device):
     """
     Generate a Grad-CAM heatmap for a given image tensor.
     Returns a NumPy heatmap array normalized to 0–255.
+
+    Parameters are frozen and the forward hook re-roots the graph at the
+    target layer's activation, so autograd only records the layers after it
+    and only the activation gradient is computed (no parameter gradients).
     """
     model.eval()
-    gradients = []
-    activations = []
+    captured = {}
 
     def forward_hook(module, inp, out):
-        activations.append(out.detach())
-
-    def backward_hook(module, grad_in, grad_out):
-        gradients.append(grad_out[0].detach())
+        activation = out.detach().requires_grad_(True)
+        captured["activation"] = activation
+        # Clone so later in-place ops (DenseNet's ReLU) don't touch the leaf;
+        # the clone is what the rest of the network sees and modifies
+        captured["output"] = activation.clone()
+        return captured["output"]
 
-    # Register hooks
-    handle_f = target_layer.register_forward_hook(forward_hook)
-    handle_b = target_layer.register_backward_hook(backward_hook)
+    handle = target_layer.register_forward_hook(forward_hook)
+    try:
+        with frozen_parameters(model), torch.enable_grad():
+            output = model(img_tensor)
+            score = output[:, 0].sum()  # binary class
+            grads, = torch.autograd.grad(score, captured.pop("activation"))
+    finally:
+        handle.remove()
 
-    # Forward pass
-    output = model(img_tensor)
-    class_idx = int(torch.sigmoid(output) >= 0.5)
-    score = output[:, 0]  # binary class
+    # The graph was freed by autograd.grad; drop the remaining references now
+    del output, score
+    acts = captured.pop("output").detach()
 
-    # Backward pass
-    model.zero_grad()
-    score.backward(retain_graph=True)
+    with torch.no_grad():
+        weights = torch.mean(grads, dim=(2, 3), keepdim=True)
+        cam = torch.sum(weights * acts, dim=1).squeeze()
+        del weights, grads, acts
 
-    # Extract activations and gradients
-    grads = gradients[0]
-    acts = activations[0]
-    weights = torch.mean(grads, dim=(2, 3), keepdim=True)
-    cam = torch.sum(weights * acts, dim=1).squeeze()
-
-    cam = torch.relu(cam)
-    cam -= cam.min()
-    cam /= cam.max() + 1e-8
-    cam = cam.cpu().numpy()
+        cam = torch.relu(cam)
+        cam -= cam.min()
+        cam /= cam.max() + 1e-8
+        cam = cam.cpu().numpy()
 
     # Resize and scale to 0–255
     heatmap = cv2.resize(cam, (224, 224))
     heatmap = np.uint8(255 * heatmap)
 
-    # Clean up
-    handle_f.remove()
-    handle_b.remove()
-
     return heatmap
@@ -0,0 +1,133 @@
+"""
+Label sampling utilities for CXR datasets.
+Works on compact NumPy arrays (no DataFrames): stratified splits, class-balanced
+subsets and weights, and patient-level de-duplication. All randomness is seeded.
+"""
+
+import csv
+from typing import NamedTuple, Optional
+import numpy as np
+
+CHUNK_ROWS = 65536
+
+
+def _parse_label(value, line):
+    """Class label as int; accepts "1" as well as "1.0" (CSVs written from float columns)"""
+    try:
+        label = float(value)
+    except ValueError:
+        label = None
+    if label is None or not label.is_integer() or not 0 <= label <= 255:
+        raise ValueError(f"Invalid label {value!r} on line {line}: expected a non-negative integer class")
+    return int(label)
+
+
+class LabelArrays(NamedTuple):
+    images: np.ndarray              # fixed-width bytes ('S'), one file name per row
+    labels: np.ndarray              # uint8 class labels
+    patients: Optional[np.ndarray]  # int32 patient codes, or None if no patient column
+
+
+def load_label_arrays(labels_csv, image_col="image", label_col="label", patient_col=None,
+                      image_suffix="", chunk_rows=CHUNK_ROWS):
+    """
+    Stream a labels CSV into compact arrays, converting every `chunk_rows` rows
+    so Python objects never exist for more than one chunk at a time.
+    `image_suffix` is appended to image names (e.g. ".jpg" for RSNA patientIds).
+    """
+    image_chunks, label_chunks, patient_chunks = [], [], []
+
+    with open(labels_csv, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        image_idx, label_idx = header.index(image_col), header.index(label_col)
+        patient_idx = header.index(patient_col) if patient_col else None
+
+        def flush(rows, first_line):
+            image_chunks.append(np.array([r[image_idx] + image_suffix for r in rows], dtype=np.bytes_))
+            label_chunks.append(np.array([_parse_label(r[label_idx], first_line + i) for i, r in enumerate(rows)],
+                                         dtype=np.uint8))
+            if patient_idx is not None:
+                patient_chunks.append(np.array([r[patient_idx] for r in rows], dtype=np.bytes_))
+
+        rows, first_line = [], 2
+        for row in reader:
+            rows.append(row)
+            if len(rows) == chunk_rows:
+                flush(rows, first_line)
+                first_line += len(rows)
+                rows = []
+        if rows:
+            flush(rows, first_line)
+
+    if not label_chunks:
+        return LabelArrays(np.empty(0, dtype="S1"), np.empty(0, dtype=np.uint8),
+                           np.empty(0, dtype=np.int32) if patient_col else None)
+    patients = None
+    if patient_col:
+        # Replace patient id strings by integer codes
+        _, codes = np.unique(np.concatenate(patient_chunks), return_inverse=True)
+        patients = codes.astype(np.int32)
+    return LabelArrays(np.concatenate(image_chunks), np.concatenate(label_chunks), patients)
+
+
+def dedupe_patients(patients):
+    """
+    Indices of the first row of every patient, in original order.
+    RSNA lists one row per bounding box, so a patient can appear several times.
+    """
+    _, first = np.unique(patients, return_index=True)
+    return np.sort(first)
+
+
+def _class_indices(labels, indices=None):
+    """Map each class to the (sorted) row indices holding it"""
+    if indices is None:
+        indices = np.arange(len(labels))
+    subset = labels[indices]
+    return {int(c): indices[subset == c] for c in np.unique(subset)}
+
+
+def balanced_subset(labels, per_class, seed=42, indices=None):
+    """
+    Deterministic subset with `per_class` rows of every class (without replacement).
+    Replaces the df.sample(...) / pd.concat(...) pattern. Returns sorted row indices.
+    """
+    rng = np.random.default_rng(seed)
+    picked = []
+    for c, rows in _class_indices(labels, indices).items():
+        if len(rows) < per_class:
+            raise ValueError(f"Class {c} has only {len(rows)} rows, cannot sample {per_class}")
+        picked.append(rng.choice(rows, per_class, replace=False))
+    return np.sort(np.concatenate(picked))
+
+
+def stratified_split(labels, test_size=0.2, seed=42, indices=None):
+    """
+    Split row indices into (train, test), keeping each class's proportion.
+    Equivalent in spirit to train_test_split(..., stratify=labels).
+    """
+    rng = np.random.default_rng(seed)
+    train, test = [], []
+    for rows in _class_indices(labels, indices).values():
+        rows = rng.permutation(rows)
+        n_test = int(round(len(rows) * test_size))
+        test.append(rows[:n_test])
+        train.append(rows[n_test:])
+    return np.sort(np.concatenate(train)), np.sort(np.concatenate(test))
+
+
+def class_balanced_weights(labels):
+    """
+    Per-row weights (1 / class count), ready for torch's WeightedRandomSampler:
+    every class is drawn with equal total probability.
+    """
+    counts = np.bincount(labels)
+    weights = 1.0 / counts[labels]
+    return weights / weights.sum()
+
+
+def balanced_sample(labels, num_samples, seed=42):
+    """Class-balanced sampling with replacement; returns `num_samples` row indices"""
+    rng = np.random.default_rng(seed)
+    return rng.choice(len(labels), num_samples, replace=True, p=class_balanced_weights(labels))